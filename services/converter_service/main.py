@@ -1,23 +1,35 @@
 """CAD Converter Service - Converts CAD files to ML-specific formats"""
 
-import base64, io, logging, os, tempfile, uuid, zipfile
+import asyncio, base64, functools, logging, os, tempfile, threading, uuid, zipfile
 from pathlib import Path
 
+import aiofiles
+import anyio
+import httpx
 import requests
 from fastapi import FastAPI, File, Form, HTTPException, UploadFile
 from fastapi.responses import FileResponse, JSONResponse
+from requests.adapters import HTTPAdapter
+from requests_toolbelt import MultipartEncoder
+from urllib3.util.retry import Retry
 from converter_service.services.cad_conversion import CADConverter
 
 # Optional dependencies
 try:
     import gmsh, meshio, numpy as np, quadpy
     from sklearn.decomposition import PCA
+    from converter_service.services.moments import accumulate_moments
     GMSH_AVAILABLE = INVARIANTS_AVAILABLE = True
 except ImportError:
     GMSH_AVAILABLE = INVARIANTS_AVAILABLE = False
 
 EMBEDDING_URL = "http://embedding-service:8000"
 RENDERING_URL = "http://rendering-service:8000"
+UPLOAD_CHUNK_SIZE = 1 << 20
+CPU_WORKER_THREADS = int(os.getenv("CPU_WORKER_THREADS", str(os.cpu_count() or 1)))
+IO_WORKER_THREADS = int(os.getenv("IO_WORKER_THREADS", "32"))  # matches the downstream connection pool size
+_STYLE_TO_MODE = {"2": "wireframe", "5": "shaded_with_edges", "6": "shaded"}
+_STEP_EXTS = frozenset({".step", ".stp"})
 
 logging.basicConfig(
     level=os.getenv("LOG_LEVEL", "INFO"),
@@ -28,6 +40,47 @@ logger = logging.getLogger(__name__)
 
 app = FastAPI(title="CAD Converter Service")
 
+# Pooled keep-alive connections to the downstream services
+SESSION = requests.Session()
+_http_adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32,
+                            max_retries=Retry(total=3, backoff_factor=0.3))
+SESSION.mount("http://", _http_adapter)
+SESSION.mount("https://", _http_adapter)
+async_client: httpx.AsyncClient | None = None
+
+# CPU-bound conversions run in worker threads, bounded to the number of cores; blocking downstream
+# calls and archive writes get their own, larger bound so they never starve conversions (or vice versa);
+# gmsh keeps global state and must only be driven by one thread at a time
+_cpu_limiter: anyio.CapacityLimiter | None = None
+_io_limiter: anyio.CapacityLimiter | None = None
+_gmsh_lock = threading.Lock()
+
+
+@app.on_event("startup")
+async def startup_event():
+    global async_client, _cpu_limiter, _io_limiter
+    _cpu_limiter = anyio.CapacityLimiter(CPU_WORKER_THREADS)
+    _io_limiter = anyio.CapacityLimiter(IO_WORKER_THREADS)
+    async_client = httpx.AsyncClient(timeout=600, limits=httpx.Limits(max_connections=32, max_keepalive_connections=32))
+    if GMSH_AVAILABLE:
+        # One gmsh session for the lifetime of the process; each /mesh request gets its own model
+        gmsh.initialize(interruptible=False)
+        gmsh.option.setNumber("General.Terminal", 0)
+        gmsh.option.setNumber("General.NumThreads", os.cpu_count() or 1)
+        gmsh.option.setNumber("Mesh.Algorithm3D", 10)  # HXT, parallel tetrahedralization
+        gmsh.option.setNumber("Geometry.OCCSewFaces", 1)
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    global async_client
+    if async_client is not None:
+        await async_client.aclose()
+        async_client = None
+    SESSION.close()
+    if GMSH_AVAILABLE and gmsh.isInitialized():
+        gmsh.finalize()
+
 
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
@@ -45,9 +98,34 @@ def _validate_file(file: UploadFile):
         raise HTTPException(status_code=400, detail="No filename provided")
 
 
+async def _run_cpu_bound(func, *args, **kwargs):
+    return await anyio.to_thread.run_sync(functools.partial(func, *args, **kwargs), limiter=_cpu_limiter)
+
+
+async def _run_io_bound(func, *args, **kwargs):
+    return await anyio.to_thread.run_sync(functools.partial(func, *args, **kwargs), limiter=_io_limiter)
+
+
 async def _save_uploaded_file(file: UploadFile, path: Path):
-    with open(path, "wb") as f:
-        f.write(await file.read())
+    async with aiofiles.open(path, "wb") as out:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            await out.write(chunk)
+
+
+def _request_vecset(ply_file: Path, output_file: Path):
+    with open(ply_file, "rb") as f:
+        encoder = MultipartEncoder(fields={"file": (ply_file.name, f, "application/octet-stream")})
+        vecset_response = SESSION.post(f"{EMBEDDING_URL}/vecset", data=encoder,
+                                       headers={"Content-Type": encoder.content_type},
+                                       timeout=300, stream=True)
+
+    if vecset_response.status_code != 200:
+        raise HTTPException(status_code=502, detail=f"VecSet service failed: {vecset_response.text}")
+
+    with open(output_file, "wb") as f:
+        for chunk in vecset_response.iter_content(chunk_size=8192):
+            if chunk:
+                f.write(chunk)
 
 
 @app.post("/convert")
@@ -69,25 +147,15 @@ async def convert_cad_file(file: UploadFile = File(...), target_format: str = Fo
         output_file = temp_dir / f"{conversion_id}.{target_format if target_format != 'vecset' else 'ply'}"
 
         if target_format == "stl":
-            converter.to_stl(output_file)
+            await _run_cpu_bound(converter.to_stl, output_file)
         elif target_format == "ply":
-            converter.to_ply(output_file)
+            await _run_cpu_bound(converter.to_ply, output_file)
         elif target_format == "vecset":
-            converter.to_ply(output_file)
+            await _run_cpu_bound(converter.to_ply, output_file)
             logger.debug("Sending PLY to VecSet service")
-            with open(output_file, "rb") as f:
-                vecset_response = requests.post(f"{EMBEDDING_URL}/vecset",
-                                              files={"file": (output_file.name, f)},
-                                              timeout=300, stream=True)
-
-            if vecset_response.status_code != 200:
-                raise HTTPException(status_code=502, detail=f"VecSet service failed: {vecset_response.text}")
-
-            output_file = temp_dir / f"{conversion_id}.npy"
-            with open(output_file, "wb") as f:
-                for chunk in vecset_response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
+            vecset_file = temp_dir / f"{conversion_id}.npy"
+            await _run_io_bound(_request_vecset, output_file, vecset_file)
+            output_file = vecset_file
 
         logger.info(f"{target_format.upper()} conversion {conversion_id} completed")
         return FileResponse(path=str(output_file), filename=f"{Path(file.filename).stem}.{output_file.suffix[1:]}",
@@ -98,6 +166,29 @@ async def convert_cad_file(file: UploadFile = File(...), target_format: str = Fo
         raise HTTPException(status_code=500, detail=f"Conversion failed: {str(e)}")
 
 
+async def _request_render(client: httpx.AsyncClient, content: bytes, file: UploadFile,
+                          style_id: str, render_mode: str) -> httpx.Response:
+    return await client.post(f"{RENDERING_URL}/render",
+                             files={"file": (file.filename, content, file.content_type or "application/octet-stream")},
+                             data={"part_number": f"multiview_{style_id}", "render_mode": render_mode, "total_imgs": "20"})
+
+
+def _write_multiview_zip(zip_path: Path, render_modes: list, responses: list) -> int:
+    total_images = 0
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_STORED) as zipf:
+        for i, (style_id, _) in enumerate(render_modes):
+            images = responses[i].json().get("images", [])
+            responses[i] = None  # drop the raw JSON body before writing the decoded images
+            logger.info(f"Style {style_id}: {len(images)} images")
+
+            decoded = list(map(base64.b64decode, (img_data.get("data", "") for img_data in images)))
+            for img_data, data in zip(images, decoded):
+                filename = f"style_{style_id}_{img_data.get('filename', f'image_{total_images}.png')}"
+                zipf.writestr(filename, data)
+                total_images += 1
+    return total_images
+
+
 @app.post("/multiview")
 async def generate_multiview(file: UploadFile = File(...), resolution: int = Form(448),
                             background: str = Form("White"), art_styles: str = Form("5")):
@@ -106,40 +197,35 @@ async def generate_multiview(file: UploadFile = File(...), resolution: int = For
     multiview_id = str(uuid.uuid4())
     logger.info(f"Multiview {multiview_id}: {file.filename}")
 
-    style_to_mode = {"2": "wireframe", "5": "shaded_with_edges", "6": "shaded"}
     try:
         styles = [s.strip() for s in art_styles.split(",")]
-        render_modes = [(s, style_to_mode.get(s, "shaded_with_edges")) for s in styles]
+        render_modes = [(s, _STYLE_TO_MODE.get(s, "shaded_with_edges")) for s in styles]
         logger.info(f"Rendering {len(render_modes)} style(s)")
 
-        content = await file.read()
         temp_dir = Path(tempfile.mkdtemp(prefix=f"multiview_{multiview_id}_"))
+        input_file = temp_dir / file.filename
+        await _save_uploaded_file(file, input_file)
         zip_path = temp_dir / f"{Path(file.filename).stem}_multiviews.zip"
-        total_images = 0
-
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for style_id, render_mode in render_modes:
-                response = requests.post(f"{RENDERING_URL}/render",
-                                       files={"file": (file.filename, io.BytesIO(content), file.content_type)},
-                                       data={"part_number": f"multiview_{style_id}", "render_mode": render_mode, "total_imgs": "20"},
-                                       timeout=600)
+        # Read once off the event loop; every style request shares the same bytes
+        content = await _run_io_bound(input_file.read_bytes)
 
-                if response.status_code != 200:
-                    raise HTTPException(status_code=502, detail=f"Rendering service failed: {response.text}")
+        responses = await asyncio.gather(
+            *[_request_render(async_client, content, file, style_id, render_mode) for style_id, render_mode in render_modes],
+            return_exceptions=True)
 
-                images = response.json().get("images", [])
-                logger.info(f"Style {style_id}: {len(images)} images")
+        for response in responses:
+            if isinstance(response, BaseException):
+                raise response
+            if response.status_code != 200:
+                raise HTTPException(status_code=502, detail=f"Rendering service failed: {response.text}")
 
-                for img_data in images:
-                    filename = f"style_{style_id}_{img_data.get('filename', f'image_{total_images}.png')}"
-                    zipf.writestr(filename, base64.b64decode(img_data.get("data", "")))
-                    total_images += 1
+        total_images = await _run_io_bound(_write_multiview_zip, zip_path, render_modes, responses)
 
         logger.info(f"Multiview {multiview_id} completed: {total_images} images")
         return FileResponse(path=str(zip_path), filename=f"{Path(file.filename).stem}_multiviews.zip",
                           media_type="application/zip", background=None)
 
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         logger.error(f"Multiview generation {multiview_id} failed: {str(e)}")
         raise HTTPException(status_code=502, detail=f"Rendering service communication failed: {str(e)}")
     except Exception as e:
@@ -149,7 +235,7 @@ async def generate_multiview(file: UploadFile = File(...), resolution: int = For
 
 @app.post("/to_voxel")
 async def convert_to_voxel(file: UploadFile = File(...), resolution: int = Form(128)):
-    """Convert CAD file to sparse voxel representation (.npz)."""
+    """Convert CAD file to a voxel grid (.npz, sparse indices or bit-packed dense, whichever is smaller)."""
     _validate_file(file)
     if not 16 <= resolution <= 512:
         raise HTTPException(status_code=400, detail="Resolution must be between 16 and 512")
@@ -164,7 +250,7 @@ async def convert_to_voxel(file: UploadFile = File(...), resolution: int = Form(
         await _save_uploaded_file(file, input_file)
         converter = CADConverter(input_file)
         output_file = temp_dir / f"{voxel_id}.npz"
-        converter.to_voxel(output_file, resolution=resolution)
+        await _run_cpu_bound(converter.to_voxel, output_file, resolution=resolution)
 
         logger.info(f"Voxel {voxel_id} completed")
         return FileResponse(path=str(output_file), filename=f"{Path(file.filename).stem}_voxel_{resolution}.npz",
@@ -175,13 +261,41 @@ async def convert_to_voxel(file: UploadFile = File(...), resolution: int = Form(
         raise HTTPException(status_code=500, detail=f"Voxel conversion failed: {str(e)}")
 
 
+def _generate_mesh(step_file_path: Path, msh_file_path: Path, mesh_size: float = None,
+                   model_name: str = "3DMesh"):
+    with _gmsh_lock:
+        gmsh.model.add(model_name)
+        try:
+            gmsh.model.occ.importShapes(str(step_file_path))
+            gmsh.model.occ.synchronize()
+
+            # Options are global to the shared gmsh session, so reset the size bounds on every call
+            if mesh_size is not None and mesh_size > 0:
+                gmsh.option.setNumber("Mesh.CharacteristicLengthMin", mesh_size)
+                gmsh.option.setNumber("Mesh.CharacteristicLengthMax", mesh_size)
+            else:
+                gmsh.option.setNumber("Mesh.CharacteristicLengthMin", 0)
+                gmsh.option.setNumber("Mesh.CharacteristicLengthMax", 1e22)
+
+            gmsh.model.mesh.generate(3)
+
+            elem_types, _, _ = gmsh.model.mesh.getElements(dim=3)
+            if not elem_types:
+                raise ValueError("No 3D mesh generated")
+
+            gmsh.write(str(msh_file_path))
+
+        finally:
+            gmsh.model.remove()
+
+
 @app.post("/mesh")
 async def generate_3d_mesh(file: UploadFile = File(...), mesh_size: float = Form(None)):
     """Generate 3D mesh from STEP file using Gmsh."""
     if not GMSH_AVAILABLE:
         raise HTTPException(status_code=501, detail="Gmsh not available")
     _validate_file(file)
-    if Path(file.filename).suffix.lower() not in [".step", ".stp"]:
+    if Path(file.filename).suffix.lower() not in _STEP_EXTS:
         raise HTTPException(status_code=400, detail="Only STEP files supported")
 
     mesh_id = str(uuid.uuid4())
@@ -194,32 +308,8 @@ async def generate_3d_mesh(file: UploadFile = File(...), mesh_size: float = Form
     try:
         await _save_uploaded_file(file, step_file_path)
 
-        gmsh.initialize(interruptible=False)
-        gmsh.option.setNumber("General.Terminal", 1)
-
-        try:
-            gmsh.model.add("3DMesh")
-            gmsh.model.occ.importShapes(str(step_file_path))
-            gmsh.model.occ.synchronize()
-
-            gmsh.option.setNumber("Geometry.OCCSewFaces", 1)
-            gmsh.model.occ.synchronize()
-
-            if mesh_size is not None and mesh_size > 0:
-                gmsh.option.setNumber("Mesh.CharacteristicLengthMin", mesh_size)
-                gmsh.option.setNumber("Mesh.CharacteristicLengthMax", mesh_size)
-
-            gmsh.model.mesh.generate(3)
-
-            elem_types, _, _ = gmsh.model.mesh.getElements(dim=3)
-            if not elem_types:
-                raise ValueError("No 3D mesh generated")
-
-            gmsh.write(str(msh_file_path))
-            logger.info(f"Mesh {mesh_id} completed")
-
-        finally:
-            gmsh.finalize()
+        await _run_cpu_bound(_generate_mesh, step_file_path, msh_file_path, mesh_size, f"mesh_{mesh_id}")
+        logger.info(f"Mesh {mesh_id} completed")
 
         return FileResponse(path=str(msh_file_path), filename=f"{Path(file.filename).stem}.msh",
                           media_type="application/octet-stream", background=None)
@@ -232,6 +322,63 @@ async def generate_3d_mesh(file: UploadFile = File(...), mesh_size: float = Form
         raise HTTPException(status_code=500, detail=f"Mesh generation failed: {str(e)}")
 
 
+# Moment permutations up to order 4
+MOMENT_PERMUTATIONS = [
+    (0, 0, 0), (1, 0, 0), (0, 1, 0), (0, 0, 1),
+    (2, 0, 0), (0, 2, 0), (0, 0, 2), (1, 1, 0), (1, 0, 1), (0, 1, 1),
+    (3, 0, 0), (0, 3, 0), (0, 0, 3), (2, 1, 0), (2, 0, 1), (1, 2, 0),
+    (0, 2, 1), (1, 0, 2), (0, 1, 2), (1, 1, 1),
+    (4, 0, 0), (0, 4, 0), (0, 0, 4), (3, 1, 0), (3, 0, 1), (1, 3, 0),
+    (0, 3, 1), (1, 0, 3), (0, 1, 3), (2, 2, 0), (2, 0, 2), (0, 2, 2),
+    (2, 1, 1), (1, 2, 1), (1, 1, 2)
+]
+
+
+def _compute_invariants(mesh_file_path: Path, normalized: bool):
+    inmsh = meshio.read(str(mesh_file_path))
+    if 'tetra' not in inmsh.cells_dict:
+        raise ValueError("Mesh must contain tetrahedral elements")
+
+    tetras_idxs = inmsh.cells_dict['tetra']
+
+    pca = PCA(n_components=3)
+    pca.fit(inmsh.points)
+    inmsh.points = pca.transform(inmsh.points)
+
+    if normalized:
+        max_expansion = np.max(inmsh.points[:, 0]) - np.min(inmsh.points[:, 0])
+        if max_expansion > 0:
+            inmsh.points = inmsh.points / max_expansion
+
+    tetras = inmsh.points[tetras_idxs]
+    scheme = quadpy.t3.get_good_scheme(4)
+
+    # Map the barycentric scheme points onto every tetrahedron and integrate all moments in one kernel
+    xq = np.einsum('tvc,vq->tqc', tetras, scheme.points)
+    volumes = np.abs(np.linalg.det(tetras[:, 1:] - tetras[:, :1])) / 6
+    moments = accumulate_moments(xq, np.asarray(scheme.weights, dtype=np.float64), volumes,
+                                 np.array(MOMENT_PERMUTATIONS, dtype=np.int64))
+    mues = {f'mue_{p}{q}{r}': float(m) for (p, q, r), m in zip(MOMENT_PERMUTATIONS, moments)}
+
+    eps = 1e-10
+    mue_200 = mues['mue_200'] if mues['mue_200'] > 0 else eps
+    mue_020 = mues['mue_020'] if mues['mue_020'] > 0 else eps
+    mue_002 = mues['mue_002'] if mues['mue_002'] > 0 else eps
+
+    pis = {}
+    for mp in MOMENT_PERMUTATIONS:
+        p, q, r = int(mp[0]), int(mp[1]), int(mp[2])
+        mue_key = f'mue_{p}{q}{r}'
+        pi_key = f'pi_{p}{q}{r}'
+        mue_var = mues[mue_key]
+        denominator = (mue_200 ** ((4*p - q - r + 2) / 10) *
+                      mue_020 ** ((4*q - p - r + 2) / 10) *
+                      mue_002 ** ((4*r - q - p + 2) / 10))
+        pis[pi_key] = float(mue_var / denominator) if denominator != 0 else 0.0
+
+    return mues, pis
+
+
 @app.post("/invariants")
 async def calculate_invariants(file: UploadFile = File(...), normalized: bool = Form(False)):
     """Calculate geometric invariants from 3D mesh (.msh)."""
@@ -247,58 +394,7 @@ async def calculate_invariants(file: UploadFile = File(...), normalized: bool =
     try:
         await _save_uploaded_file(file, mesh_file_path)
 
-        # Moment permutations up to order 4
-        moment_permutations = [
-            (0, 0, 0), (1, 0, 0), (0, 1, 0), (0, 0, 1),
-            (2, 0, 0), (0, 2, 0), (0, 0, 2), (1, 1, 0), (1, 0, 1), (0, 1, 1),
-            (3, 0, 0), (0, 3, 0), (0, 0, 3), (2, 1, 0), (2, 0, 1), (1, 2, 0),
-            (0, 2, 1), (1, 0, 2), (0, 1, 2), (1, 1, 1),
-            (4, 0, 0), (0, 4, 0), (0, 0, 4), (3, 1, 0), (3, 0, 1), (1, 3, 0),
-            (0, 3, 1), (1, 0, 3), (0, 1, 3), (2, 2, 0), (2, 0, 2), (0, 2, 2),
-            (2, 1, 1), (1, 2, 1), (1, 1, 2)
-        ]
-
-        inmsh = meshio.read(str(mesh_file_path))
-        if 'tetra' not in inmsh.cells_dict:
-            raise ValueError("Mesh must contain tetrahedral elements")
-
-        tetras_idxs = inmsh.cells_dict['tetra']
-
-        pca = PCA(n_components=3)
-        pca.fit(inmsh.points)
-        inmsh.points = pca.transform(inmsh.points)
-
-        if normalized:
-            max_expansion = np.max(inmsh.points[:, 0]) - np.min(inmsh.points[:, 0])
-            if max_expansion > 0:
-                inmsh.points = inmsh.points / max_expansion
-
-        tetras = inmsh.points[tetras_idxs]
-        tetras_s = np.stack(tetras, axis=-2)
-        scheme = quadpy.t3.get_good_scheme(4)
-
-        mues = {}
-        for mp in moment_permutations:
-            moment_key = f'mue_{mp[0]}{mp[1]}{mp[2]}'
-            l = lambda x, p=mp: x[0]**p[0] * x[1]**p[1] * x[2]**p[2]
-            mues[moment_key] = float(scheme.integrate(l, tetras_s).sum())
-
-        eps = 1e-10
-        mue_200 = mues['mue_200'] if mues['mue_200'] > 0 else eps
-        mue_020 = mues['mue_020'] if mues['mue_020'] > 0 else eps
-        mue_002 = mues['mue_002'] if mues['mue_002'] > 0 else eps
-
-        pis = {}
-        for mp in moment_permutations:
-            p, q, r = int(mp[0]), int(mp[1]), int(mp[2])
-            mue_key = f'mue_{p}{q}{r}'
-            pi_key = f'pi_{p}{q}{r}'
-            mue_var = mues[mue_key]
-            denominator = (mue_200 ** ((4*p - q - r + 2) / 10) *
-                          mue_020 ** ((4*q - p - r + 2) / 10) *
-                          mue_002 ** ((4*r - q - p + 2) / 10))
-            pis[pi_key] = float(mue_var / denominator) if denominator != 0 else 0.0
-
+        mues, pis = await _run_cpu_bound(_compute_invariants, mesh_file_path, normalized)
         logger.info(f"Invariants {invariants_id} completed: {len(mues)} moments, {len(pis)} invariants")
 
         return JSONResponse(content={
@@ -1,23 +1,104 @@
 """CAD Conversion Service - Handles conversion between CAD formats."""
 
-import glob
+import errno
 import logging
 import os
 import shutil
 import sys
+import threading
+import uuid
+import zipfile
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Union
+from typing import Optional, Union
 
 import cascadio
 import numpy as np
-import open3d as o3d
 import trimesh
 from PIL import Image
-from scipy import sparse
 import stltovoxel
 
+from converter_service.services.voxels import count_occupied, occupied_indices
+
 logger = logging.getLogger(__name__)
 
+# RAM-backed scratch space for intermediate files; CONVERTER_SCRATCH_DIR overrides it (empty disables it)
+# and the converter's temp dir is used if unset, missing or full
+_SCRATCH_DIR = os.getenv("CONVERTER_SCRATCH_DIR", "/dev/shm")
+_SCRATCH_DIR = Path(_SCRATCH_DIR) if _SCRATCH_DIR and Path(_SCRATCH_DIR).is_dir() else None
+# The OBJ text is much larger than the STEP it is tessellated from; the scratch dir is only used with
+# at least this much free space (a multiple of the STEP size, but never less than the minimum)
+_SCRATCH_SIZE_FACTOR = 20
+_SCRATCH_MIN_FREE = 256 << 20
+
+
+class _ThreadLocalStdout:
+    """sys.stdout stand-in that forwards to the original stream unless the calling thread redirected it."""
+
+    def __init__(self, default):
+        self._default = default
+        self._local = threading.local()
+
+    def _target(self):
+        return getattr(self._local, "target", None) or self._default
+
+    def write(self, s):
+        return self._target().write(s)
+
+    def flush(self):
+        return self._target().flush()
+
+    def __getattr__(self, name):
+        return getattr(self._target(), name)
+
+
+_stdout_install_lock = threading.Lock()
+_devnull = open(os.devnull, "w")
+
+
+@contextmanager
+def _stdout_silenced():
+    """Discard the calling thread's stdout writes inside the block; other threads keep printing.
+
+    stltovoxel prints progress for every layer. Unlike redirect_stdout, this does not swap the
+    process-global sys.stdout per call, so concurrent voxelizations need no lock.
+    """
+    with _stdout_install_lock:
+        if not isinstance(sys.stdout, _ThreadLocalStdout):
+            sys.stdout = _ThreadLocalStdout(sys.stdout)
+        proxy = sys.stdout
+    proxy._local.target = _devnull
+    try:
+        yield
+    finally:
+        proxy._local.target = None
+
+
+def _savez_fast(output_path: Path, **arrays) -> None:
+    """Write arrays to an .npz archive like np.savez_compressed, but at a fast zlib level."""
+    with zipfile.ZipFile(output_path, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=1) as zf:
+        for name, value in arrays.items():
+            with zf.open(f"{name}.npy", "w", force_zip64=True) as f:
+                np.lib.format.write_array(f, np.asanyarray(value), allow_pickle=False)
+
+
+def _pad_index_maps(width: int, height: int, size: int):
+    """Source row/column indices and offsets reproducing ImageOps.pad(..., (size, size), NEAREST)."""
+    if width > height:
+        new_width, new_height = size, round(height / width * size)
+    elif width < height:
+        new_width, new_height = round(width / height * size), size
+    else:
+        new_width = new_height = size
+
+    def nearest(n_in, n_out):
+        # Resample an index ramp through Pillow itself so the mapping matches its rounding exactly
+        ramp = Image.fromarray(np.arange(n_in, dtype=np.int32)[None, :])
+        return np.asarray(ramp.resize((n_out, 1), Image.Resampling.NEAREST))[0]
+
+    return (nearest(height, new_height), nearest(width, new_width),
+            round((size - new_height) * 0.5), round((size - new_width) * 0.5))
+
 
 class CADConversionError(Exception):
     """Custom exception for CAD conversion errors."""
@@ -45,8 +126,49 @@ class CADConverter:
 
         self.temp_dir = self.input_file.parent / "tmp"
         self.temp_dir.mkdir(exist_ok=True)
+        self._mesh = None
         logger.info(f"Initialized converter for {self.input_file}")
 
+    def _load_mesh(self) -> trimesh.Trimesh:
+        """Load the input file as a single triangle mesh (STEP is tessellated via cascadio)."""
+        if self.input_file.suffix.lower() in {".step", ".stp"}:
+            scratch_dir = self._scratch_dir()
+            try:
+                return self._load_step_via(scratch_dir)
+            except OSError as e:
+                # Only a full scratch dir is retried on disk; every other failure is the file's own
+                if scratch_dir == self.temp_dir or e.errno not in (errno.ENOSPC, errno.EDQUOT):
+                    raise
+                logger.warning(f"Scratch dir {scratch_dir} is full, retrying STEP tessellation in {self.temp_dir}")
+                return self._load_step_via(self.temp_dir)
+        return trimesh.load(str(self.input_file), force="mesh", process=False, maintain_order=True)
+
+    def _scratch_dir(self) -> Path:
+        """Directory for the intermediate OBJ: the RAM-backed scratch dir if it has room, else the temp dir."""
+        if _SCRATCH_DIR is None:
+            return self.temp_dir
+        needed = max(_SCRATCH_MIN_FREE, _SCRATCH_SIZE_FACTOR * self.input_file.stat().st_size)
+        if shutil.disk_usage(_SCRATCH_DIR).free < needed:
+            return self.temp_dir
+        return _SCRATCH_DIR
+
+    def _load_step_via(self, scratch_dir: Path) -> trimesh.Trimesh:
+        """Tessellate the STEP file into a temporary OBJ in scratch_dir and load it."""
+        temp_obj = scratch_dir / f"{self.file_name}_{uuid.uuid4().hex}.obj"
+        try:
+            # Geometry only: skip colour/material extraction and the .mtl side file
+            cascadio.step_to_obj(str(self.input_file), str(temp_obj), use_colors=False)
+            return trimesh.load(str(temp_obj), file_type="obj", force="mesh", process=False,
+                                maintain_order=True)
+        finally:
+            temp_obj.unlink(missing_ok=True)
+
+    def _get_mesh(self) -> trimesh.Trimesh:
+        """Return the input mesh, loading it once and reusing it for all conversions."""
+        if self._mesh is None:
+            self._mesh = self._load_mesh()
+        return self._mesh
+
     def to_stl(self, output_path: Union[str, Path]) -> Path:
         """Convert CAD file to STL format."""
         output_path = Path(output_path)
@@ -54,14 +176,7 @@ class CADConverter:
         logger.info(f"Converting to STL: {self.input_file}")
 
         try:
-            if self.input_file.suffix.lower() in {".step", ".stp"}:
-                temp_obj = self.temp_dir / f"{self.file_name}_temp.obj"
-                cascadio.step_to_obj(str(self.input_file), str(temp_obj))
-                mesh = trimesh.load(str(temp_obj), file_type="obj")
-            else:
-                mesh = trimesh.load(str(self.input_file))
-
-            mesh.export(str(output_path), file_type="stl")
+            self._get_mesh().export(str(output_path), file_type="stl")
 
             if not output_path.exists():
                 raise CADConversionError("STL file was not created")
@@ -83,20 +198,16 @@ class CADConverter:
         logger.info(f"Converting to PLY: {point_count} points")
 
         try:
-            temp_stl = self.temp_dir / f"{self.file_name}_temp.stl"
-            if not temp_stl.exists():
-                self.to_stl(temp_stl)
-
-            mesh = o3d.io.read_triangle_mesh(str(temp_stl))
+            mesh = self._get_mesh()
             if len(mesh.vertices) == 0:
                 raise CADConversionError("No vertices found in mesh")
 
-            point_cloud = mesh.sample_points_uniformly(number_of_points=point_count)
-            if len(point_cloud.points) == 0:
+            points, _ = trimesh.sample.sample_surface(mesh, point_count)
+            if len(points) == 0:
                 raise CADConversionError("Failed to sample points from mesh")
 
-            success = o3d.io.write_point_cloud(str(output_path), point_cloud)
-            if not success or not output_path.exists():
+            trimesh.PointCloud(points).export(str(output_path), file_type="ply")
+            if not output_path.exists():
                 raise CADConversionError("PLY file was not created")
 
             logger.info(f"PLY completed: {output_path}")
@@ -106,81 +217,75 @@ class CADConverter:
             logger.error(f"PLY conversion failed: {str(e)}")
             raise CADConversionError(f"PLY conversion failed: {str(e)}") from e
 
-    def to_voxel(self, output_path: Union[str, Path], resolution: int = 128) -> Path:
-        """Convert CAD file to sparse voxel representation (.npz format)."""
+    def to_voxel(self, output_path: Union[str, Path], resolution: int = 128,
+                 sparse: Optional[bool] = None) -> Path:
+        """Convert CAD file to a voxel grid (.npz format).
+
+        The grid is stored either as occupied (z, y, x) indices (encoding "sparse", key "indices") or as a
+        bit-packed dense volume (encoding "packed", key "packed"), unpacked with
+        np.unpackbits(packed)[:np.prod(shape)].reshape(shape).astype(bool). By default (sparse=None) the
+        smaller of the two is written.
+        """
         output_path = Path(output_path)
         output_path.parent.mkdir(parents=True, exist_ok=True)
         logger.info(f"Converting to voxels: resolution {resolution}")
 
         try:
-            temp_stl = self.temp_dir / f"{self.file_name}_temp.stl"
-            if not temp_stl.exists():
-                self.to_stl(temp_stl)
-
-            slices_dir = self.temp_dir / "slices_temp"
-            slices_dir.mkdir(exist_ok=True)
-            temp_slice_pattern = slices_dir / "slice.png"
-
+            # Voxelize the cached mesh in memory; stltovoxel shifts/scales the triangle array in place,
+            # so hand it a float32 copy (the precision its STL reader would have produced)
+            triangles = np.array(self._get_mesh().triangles, dtype=np.float32)
             try:
-                old_stdout = sys.stdout
-                sys.stdout = open(os.devnull, 'w')
-                stltovoxel.convert_file(str(temp_stl), str(temp_slice_pattern), resolution)
-                sys.stdout.close()
-                sys.stdout = old_stdout
+                with _stdout_silenced():
+                    volume, _, _ = stltovoxel.convert_mesh(triangles, resolution=resolution, parallel=False)
             except Exception as e:
-                sys.stdout = old_stdout
                 raise CADConversionError(f"Voxel slice generation failed: {str(e)}")
 
-            slice_files = sorted(glob.glob(str(slices_dir / "*.png")))
-            if not slice_files:
+            if volume.shape[0] == 0:
                 raise CADConversionError("No voxel slices generated")
 
-            logger.info(f"Generated {len(slice_files)} slices")
-
-            voxel_slices = []
-            for slice_file in slice_files:
-                image = Image.open(slice_file)
-                image = self._expand_to_square(image, 0)
-                image = image.resize((resolution, resolution), Image.Resampling.NEAREST)
-                voxel_slices.append(np.array(image, dtype=np.uint8))
-
-            voxel_array = np.array(voxel_slices, dtype=np.uint8)
-            voxel_binary = (voxel_array > 0).astype(np.uint8)
-            occupied_indices = np.argwhere(voxel_binary)
-
-            np.savez_compressed(output_path, indices=occupied_indices, shape=voxel_binary.shape,
-                              resolution=resolution, format_version="1.0")
+            # Same layout the PNG slice export produced: one voxel of padding on every side and
+            # the y axis flipped so that (0, 0) is the lower left corner of each slice
+            slices = np.pad(volume != 0, 1)[:, ::-1, :]
+            logger.info(f"Generated {len(slices)} slices")
+
+            # Square padding/nearest resize to resolution x resolution is a fixed index mapping
+            # applied to all slices at once
+            shape = (len(slices), resolution, resolution)
+            voxels = np.zeros(shape, dtype=bool)
+            height, width = slices.shape[1:]
+            rows, cols, dy, dx = _pad_index_maps(width, height, resolution)
+            if (len(rows), len(cols)) != (height, width):
+                slices = slices[:, rows][:, :, cols]
+            voxels[:, dy:dy + len(rows), dx:dx + len(cols)] = slices
+
+            # Occupied (z, y, x) indices use the smallest unsigned integer type that fits the grid;
+            # dense volumes are cheaper as one bit per voxel
+            index_dtype = np.min_scalar_type(max(shape) - 1)
+            slice_counts = count_occupied(voxels)
+            occupied = int(slice_counts.sum())
+            if sparse is None:
+                sparse = occupied * 3 * index_dtype.itemsize < (voxels.size + 7) // 8
+
+            if sparse:
+                data = {"indices": occupied_indices(voxels, slice_counts, index_dtype)}
+            else:
+                data = {"packed": np.packbits(voxels, axis=None)}
 
-            shutil.rmtree(slices_dir, ignore_errors=True)
+            _savez_fast(output_path, **data, shape=shape, resolution=resolution,
+                        encoding="sparse" if sparse else "packed", format_version="2.1")
 
             if not output_path.exists():
                 raise CADConversionError("Voxel file was not created")
 
-            occupancy = len(occupied_indices) / np.prod(voxel_binary.shape) * 100
-            logger.info(f"Voxel completed: {output_path} (shape: {voxel_binary.shape}, occupancy: {occupancy:.2f}%)")
+            occupancy = occupied / voxels.size * 100
+            logger.info(f"Voxel completed: {output_path} (shape: {shape}, occupancy: {occupancy:.2f}%, "
+                        f"encoding: {'sparse' if sparse else 'packed'})")
             return output_path
 
         except Exception as e:
             logger.error(f"Voxel conversion failed: {str(e)}")
-            if 'slices_dir' in locals():
-                shutil.rmtree(slices_dir, ignore_errors=True)
             raise CADConversionError(f"Voxel conversion failed: {str(e)}") from e
 
-    @staticmethod
-    def _expand_to_square(pil_img: Image.Image, background_color) -> Image.Image:
-        """Expand image to square with padding."""
-        width, height = pil_img.size
-        if width == height:
-            return pil_img
-        elif width > height:
-            result = Image.new(pil_img.mode, (width, width), background_color)
-            result.paste(pil_img, (0, (width - height) // 2))
-            return result
-        else:
-            result = Image.new(pil_img.mode, (height, height), background_color)
-            result.paste(pil_img, ((height - width) // 2, 0))
-            return result
-
     def get_info(self) -> dict:
         """Get basic information about the input file."""
         stat = self.input_file.stat()
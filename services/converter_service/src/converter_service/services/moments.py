@@ -0,0 +1,38 @@
+"""Numba kernels for integrating geometric moments over tetrahedral meshes."""
+
+import numba
+import numpy as np
+
+
+def accumulate_moments(xq: np.ndarray, weights: np.ndarray, volumes: np.ndarray, exponents: np.ndarray) -> np.ndarray:
+    """
+    Integrate the monomials x^p * y^q * z^r over all tetrahedra in one fused pass.
+
+    Args:
+        xq: quadrature points mapped onto each tetrahedron, shape (n_tet, n_quad, 3)
+        weights: quadrature weights of the reference scheme, shape (n_quad,)
+        volumes: tetrahedron volumes, shape (n_tet,)
+        exponents: (p, q, r) exponent triples, shape (n_moments, 3)
+
+    Returns:
+        np.ndarray: summed moments, shape (n_moments,)
+    """
+    return _accumulate_moments(xq, weights, volumes, exponents)
+
+
+# Serial on purpose: the kernel runs inside the converter's worker threads (several requests at once),
+# and Numba's default parallel runtime must not be entered from more than one thread
+@numba.njit(fastmath=True, cache=True)
+def _accumulate_moments(xq, weights, volumes, exponents):
+    n_tet, n_quad = xq.shape[0], xq.shape[1]
+    n_moments = exponents.shape[0]
+    moments = np.zeros(n_moments)
+
+    for t in range(n_tet):
+        for q in range(n_quad):
+            x, y, z = xq[t, q, 0], xq[t, q, 1], xq[t, q, 2]
+            w = weights[q] * volumes[t]
+            for m in range(n_moments):
+                moments[m] += w * x ** exponents[m, 0] * y ** exponents[m, 1] * z ** exponents[m, 2]
+
+    return moments
@@ -0,0 +1,72 @@
+"""Numba kernels for extracting occupied voxel indices from dense occupancy volumes.
+
+The kernels are serial on purpose: they run inside the converter's worker threads (several requests
+at once), and Numba's default parallel runtime must not be entered from more than one thread.
+"""
+
+import numba
+import numpy as np
+
+
+def count_occupied(voxels: np.ndarray) -> np.ndarray:
+    """
+    Count the occupied voxels of every z-slice.
+
+    Args:
+        voxels: boolean occupancy volume, shape (n_z, n_y, n_x)
+
+    Returns:
+        np.ndarray: occupied voxel count per slice, shape (n_z,)
+    """
+    return _count_occupied(voxels)
+
+
+def occupied_indices(voxels: np.ndarray, counts: np.ndarray, dtype) -> np.ndarray:
+    """
+    Emit the (z, y, x) indices of all occupied voxels in one pass, in np.argwhere order.
+
+    Args:
+        voxels: boolean occupancy volume, shape (n_z, n_y, n_x)
+        counts: per-slice occupied counts from count_occupied
+        dtype: integer dtype of the returned indices (must hold the largest grid dimension)
+
+    Returns:
+        np.ndarray: occupied indices, shape (n_occupied, 3)
+    """
+    offsets = np.zeros(len(counts), dtype=np.int64)
+    np.cumsum(counts[:-1], out=offsets[1:])
+    out = np.empty((int(counts.sum()), 3), dtype=dtype)
+    _fill_indices(voxels, offsets, out)
+    return out
+
+
+@numba.njit(cache=True)
+def _count_occupied(voxels):
+    n_z, n_y, n_x = voxels.shape
+    counts = np.zeros(n_z, dtype=np.int64)
+
+    for z in range(n_z):
+        count = 0
+        for y in range(n_y):
+            for x in range(n_x):
+                if voxels[z, y, x]:
+                    count += 1
+        counts[z] = count
+
+    return counts
+
+
+@numba.njit(cache=True)
+def _fill_indices(voxels, offsets, out):
+    n_z, n_y, n_x = voxels.shape
+
+    # Every slice writes its own contiguous block of rows starting at its prefix-sum offset
+    for z in range(n_z):
+        i = offsets[z]
+        for y in range(n_y):
+            for x in range(n_x):
+                if voxels[z, y, x]:
+                    out[i, 0] = z
+                    out[i, 1] = y
+                    out[i, 2] = x
+                    i += 1
@@ -5,14 +5,18 @@ Service for converting CAD files into ML-generated embeddings
 """
 
 import asyncio
+import functools
 import gc
 import logging
 import os
 import tempfile
 import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+import aiofiles
+import numpy as np
 from fastapi import FastAPI, File, Form, HTTPException, UploadFile
 from fastapi.responses import FileResponse, JSONResponse
 
@@ -23,6 +27,15 @@ from embedding_service.services.vecset import VecSetEncoder
 # -----------------------------
 ENCODER_IDLE_SECONDS = int(os.getenv("ENCODER_IDLE_SECONDS", "300"))  # 5 min default
 ENCODER_SWEEP_INTERVAL_SECONDS = int(os.getenv("ENCODER_SWEEP_INTERVAL_SECONDS", "15"))
+# torch.compile the encoder on CUDA; a compiled encoder is loaded and warmed at startup and stays resident
+# (exempt from the idle unload), since every reload would compile and capture its CUDA graphs again
+VECSET_COMPILE = os.getenv("VECSET_COMPILE", "1") == "1"
+VECSET_MIXED_PRECISION = os.getenv("VECSET_MIXED_PRECISION", "1") == "1"  # bf16 autocast on CUDA
+UPLOAD_CHUNK_SIZE = 1 << 20  # uploads are streamed to disk in 1 MiB chunks
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "8"))  # max /vecset requests per encoder forward
+MAX_BATCH_WAIT_MS = int(os.getenv("MAX_BATCH_WAIT_MS", "20"))  # how long a batch waits to fill up
+# Batch sizes the compiled encoder is warmed up for (powers of two up to MAX_BATCH_SIZE); batches are padded up
+BATCH_BUCKETS = tuple(sorted({1 << i for i in range(MAX_BATCH_SIZE.bit_length())} | {MAX_BATCH_SIZE}))
 
 # Simple logging setup from environment variables
 logging.basicConfig(
@@ -41,6 +54,15 @@ encoder = None
 _encoder_lock = asyncio.Lock()
 _last_used_ts = 0.0
 _sweeper_task: asyncio.Task | None = None
+_warmup_task: asyncio.Task | None = None
+
+# Model loading and inference run on one dedicated thread: GPU work is serialized anyway, the event loop
+# stays responsive, and torch.compile's CUDA graphs are captured and replayed on the same thread
+_inference_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vecset-inference")
+
+# Micro-batching of plain /vecset requests: (surface, future) items drained by one consumer
+_batch_queue: asyncio.Queue | None = None
+_batcher_task: asyncio.Task | None = None
 
 
 def _touch_encoder_usage():
@@ -108,7 +130,12 @@ async def _ensure_encoder_loaded() -> VecSetEncoder:
 
         try:
             logger.info("Loading VecSet encoder (lazy-load)...")
-            encoder = VecSetEncoder()
+            encoder = await asyncio.get_running_loop().run_in_executor(
+                _inference_executor, functools.partial(
+                    VecSetEncoder, compile_model=VECSET_COMPILE, mixed_precision=VECSET_MIXED_PRECISION,
+                    batch_sizes=BATCH_BUCKETS,
+                )
+            )
             if not encoder.is_ready():
                 # Some encoders may load async or partially - treat as failure
                 raise RuntimeError("VecSet encoder initialized but not ready")
@@ -135,8 +162,8 @@ async def _idle_sweeper_loop():
         while True:
             await asyncio.sleep(ENCODER_SWEEP_INTERVAL_SECONDS)
 
-            # If encoder isn't loaded, nothing to do
-            if encoder is None:
+            # If encoder isn't loaded, nothing to do; compiled encoders stay resident
+            if encoder is None or encoder.is_compiled():
                 continue
 
             idle_for = time.time() - _last_used_ts
@@ -157,23 +184,94 @@ async def _idle_sweeper_loop():
         logger.error(f"Idle sweeper crashed: {str(e)}", exc_info=True)
 
 
+async def _batch_consumer_loop():
+    """
+    Background loop that packs queued point clouds into one encoder forward pass.
+    A batch is dispatched when MAX_BATCH_SIZE items are queued or MAX_BATCH_WAIT_MS has passed.
+    """
+    loop = asyncio.get_running_loop()
+    logger.info(f"Batch consumer started (max_batch={MAX_BATCH_SIZE}, max_wait={MAX_BATCH_WAIT_MS}ms)")
+    while True:
+        batch = [await _batch_queue.get()]
+        deadline = loop.time() + MAX_BATCH_WAIT_MS / 1000
+        while len(batch) < MAX_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(_batch_queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        # Requests whose client went away are dropped before running the model
+        batch = [item for item in batch if not item[1].done()]
+        if not batch:
+            continue
+
+        try:
+            # Always use the current encoder, never one captured with a job before an unload/reload;
+            # encode_batch pads the batch up to the next warmed size in BATCH_BUCKETS
+            enc = await _ensure_encoder_loaded()
+            vecsets = await loop.run_in_executor(
+                _inference_executor, enc.encode_batch, [surface for surface, _ in batch]
+            )
+            for (_, future), vecset in zip(batch, vecsets):
+                if not future.done():
+                    future.set_result(vecset)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+
+async def _warmup_encoder():
+    """
+    Load (and compile/warm) the encoder at startup; failures are retried lazily by the first request.
+    """
+    try:
+        await _ensure_encoder_loaded()
+    except Exception as e:
+        logger.warning(f"Encoder warm-up at startup failed, falling back to lazy-load: {str(e)}")
+
+
 @app.on_event("startup")
 async def startup_event():
     """
-    Start background sweeper.
-    NOTE: We do NOT load the encoder here anymore (lazy-load instead).
+    Start background sweeper and batch consumer.
+    NOTE: The encoder is lazy-loaded, unless VECSET_COMPILE is set: then it is compiled and warmed
+    in the background right away, so no request pays for compilation.
     """
-    global _sweeper_task, _last_used_ts
+    global _sweeper_task, _batcher_task, _batch_queue, _last_used_ts, _warmup_task
     _last_used_ts = time.time()
     _sweeper_task = asyncio.create_task(_idle_sweeper_loop())
+    _batch_queue = asyncio.Queue()
+    _batcher_task = asyncio.create_task(_batch_consumer_loop())
+    if VECSET_COMPILE:
+        _warmup_task = asyncio.create_task(_warmup_encoder())
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """
-    Graceful shutdown: stop sweeper and unload encoder.
+    Graceful shutdown: stop sweeper and batch consumer, unload encoder.
     """
-    global _sweeper_task
+    global _sweeper_task, _batcher_task, _warmup_task
+    if _warmup_task is not None:
+        _warmup_task.cancel()
+        try:
+            await _warmup_task
+        except asyncio.CancelledError:
+            pass
+        _warmup_task = None
+
+    if _batcher_task is not None:
+        _batcher_task.cancel()
+        try:
+            await _batcher_task
+        except asyncio.CancelledError:
+            pass
+        _batcher_task = None
+
     if _sweeper_task is not None:
         _sweeper_task.cancel()
         try:
@@ -185,6 +283,7 @@ async def shutdown_event():
     # Unload encoder on shutdown
     async with _encoder_lock:
         _unload_encoder()
+    _inference_executor.shutdown(wait=False, cancel_futures=True)
 
 
 @app.exception_handler(Exception)
@@ -230,10 +329,10 @@ async def convert_to_vecset(
     ply_file = temp_dir / file.filename
 
     try:
-        # Save uploaded file
-        content = await file.read()
-        with open(ply_file, "wb") as f:
-            f.write(content)
+        # Save uploaded file without blocking the event loop on disk writes
+        async with aiofiles.open(ply_file, "wb") as f:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                await f.write(chunk)
 
         # Ensure encoder loaded (lazy-load)
         try:
@@ -244,11 +343,23 @@ async def convert_to_vecset(
         # Convert to VecSet
         output_file = temp_dir / f"{conversion_id}.npy"
 
-        result = enc.to_vecset(
-            ply_file=ply_file,
-            output_path=output_file,
-            export_reconstruction=export_reconstruction,
-        )
+        if export_reconstruction:
+            # Reconstruction decodes the full query grid and stays unbatched
+            await asyncio.get_running_loop().run_in_executor(
+                _inference_executor,
+                functools.partial(
+                    enc.to_vecset,
+                    ply_file=ply_file,
+                    output_path=output_file,
+                    export_reconstruction=export_reconstruction,
+                ),
+            )
+        else:
+            surface = await asyncio.to_thread(enc.load_surface, ply_file)
+            future = asyncio.get_running_loop().create_future()
+            await _batch_queue.put((surface, future))
+            vecset = await future
+            await asyncio.to_thread(np.save, str(output_file), vecset)
 
         _touch_encoder_usage()
 
@@ -116,10 +116,17 @@ class VecSetAutoEncoder(nn.Module):
         
         if self.query_type == 'point':
             sampled_pc = subsample(pc, N, self.num_latents)
-            x = self.point_embed(sampled_pc)
+            return self.encode_sampled(sampled_pc, pc)
         elif self.query_type == 'learnable':
             x = repeat(self.latents.weight, 'n d -> b n d', b = B)
-            
+            return self.encode_queries(x, pc)
+
+    def encode_sampled(self, sampled_pc, pc):
+        # dense part of encode for point queries, after the farthest point sampling
+        x = self.point_embed(sampled_pc)
+        return self.encode_queries(x, pc)
+
+    def encode_queries(self, x, pc):
         pc_embeddings = self.point_embed(pc)
 
         cross_attn, cross_ff = self.cross_attend_blocks
@@ -6,7 +6,7 @@ Converts PLY point cloud files to VecSet representation using pre-trained models
 
 import logging
 from pathlib import Path
-from typing import Dict, Optional, Union
+from typing import Dict, List, Optional, Sequence, Union
 
 import mcubes
 import numpy as np
@@ -14,6 +14,13 @@ import torch
 import trimesh
 
 from embedding_service.models import autoencoder
+from embedding_service.models.utils import subsample
+
+# Optional GPU marching cubes for reconstructions (falls back to PyMCubes on the CPU)
+try:
+    from torchmcubes import marching_cubes as cuda_marching_cubes
+except ImportError:
+    cuda_marching_cubes = None
 
 logger = logging.getLogger(__name__)
 
@@ -35,15 +42,22 @@ class VecSetEncoder:
     REQUIRED_POINT_COUNT = 8192
     DEFAULT_DENSITY = 256
 
-    def __init__(self, model_path: Optional[Union[str, Path]] = None):
+    def __init__(self, model_path: Optional[Union[str, Path]] = None, compile_model: bool = True,
+                 mixed_precision: bool = True, batch_sizes: Sequence[int] = (1,)):
         """
         Initialize VecSet encoder.
         
         Args:
             model_path: Path to model checkpoint (optional)
+            compile_model: Compile the encoder blocks with torch.compile (CUDA only)
+            mixed_precision: Run inference under BF16 autocast (CUDA only)
+            batch_sizes: Batch sizes the compiled encoder is warmed up for; batches are padded up to these
         """
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        logger.info(f"Using device: {self.device}")
+        self.mixed_precision = mixed_precision and self.device.type == "cuda"
+        self.batch_sizes = sorted(set(batch_sizes))
+        self._compiled_encode = None
+        logger.info(f"Using device: {self.device} (bf16 autocast: {self.mixed_precision})")
         
         # Set model path
         if model_path:
@@ -57,10 +71,13 @@ class VecSetEncoder:
         
         # Load model
         self._load_model()
+        if compile_model and self.device.type == "cuda":
+            self._compile_encoder()
         
         # Setup grid for reconstruction
         self.density = self.DEFAULT_DENSITY
         self.gap = 2.0 / self.density
+        # Keep the reconstruction grid resident on the device instead of copying it per request
         self.grid = self._create_grid()
         
         logger.info("VecSet encoder initialized successfully")
@@ -75,7 +92,14 @@ class VecSetEncoder:
             self.encoder.eval()
             
             # Load weights
-            checkpoint = torch.load(self.model_path, map_location=self.device, weights_only=False)
+            # Memory-map the checkpoint on the CPU; tensors are paged in while being copied into the model
+            # (weights_only stays off: training checkpoints also carry the argparse namespace).
+            # mmap needs the zipfile format, so legacy checkpoints are read into memory as before
+            try:
+                checkpoint = torch.load(self.model_path, map_location="cpu", mmap=True, weights_only=False)
+            except RuntimeError as e:
+                logger.info(f"Checkpoint cannot be memory-mapped ({str(e)}), loading it into memory")
+                checkpoint = torch.load(self.model_path, map_location="cpu", weights_only=False)
             
             if "model" in checkpoint:
                 state_dict = checkpoint["model"]
@@ -91,16 +115,41 @@ class VecSetEncoder:
         except Exception as e:
             raise VecSetError(f"Failed to load model: {str(e)}") from e
 
+    def _compile_encoder(self):
+        """Compile the model's encode_sampled for the served batch sizes, keeping the eager model on failure."""
+        if self.encoder.query_type != "point":
+            return
+        try:
+            # Only the model's encode_sampled step of the batched path is compiled: it sees one fixed shape
+            # per warmed batch size. Farthest point sampling is a Python loop and stays eager, and the model's
+            # modules stay untouched so reconstruction (encode + chunked decode) keeps running eagerly
+            compiled_encode = torch.compile(self.encoder.encode_sampled, mode="reduce-overhead", dynamic=False)
+
+            # Warm up every batch size so requests never pay for compilation and graph capture
+            with torch.inference_mode(), self._autocast():
+                for batch_size in self.batch_sizes:
+                    dummy = torch.rand(batch_size, self.REQUIRED_POINT_COUNT, 3, device=self.device) * 2 - 1
+                    sampled = subsample(dummy, self.REQUIRED_POINT_COUNT, self.encoder.num_latents)
+                    for _ in range(3):
+                        compiled_encode(sampled, dummy)
+
+            self._compiled_encode = compiled_encode
+            logger.info(f"Encoder encode_sampled compiled with torch.compile for batch sizes {self.batch_sizes}")
+
+        except Exception as e:
+            self._compiled_encode = None
+            logger.warning(f"torch.compile failed, using eager encoder: {str(e)}")
+
+    def _autocast(self):
+        """BF16 autocast context for inference (a no-op unless mixed precision is enabled)."""
+        return torch.autocast(device_type=self.device.type, dtype=torch.bfloat16, enabled=self.mixed_precision)
+
     def _create_grid(self) -> torch.Tensor:
-        """Create 3D grid for reconstruction."""
-        x = np.linspace(-1, 1, self.density + 1)
-        y = np.linspace(-1, 1, self.density + 1)
-        z = np.linspace(-1, 1, self.density + 1)
-        xv, yv, zv = np.meshgrid(x, y, z)
-        
-        return torch.from_numpy(
-            np.stack([xv, yv, zv]).astype(np.float32)
-        ).view(3, -1).transpose(0, 1)[None]
+        """Create 3D grid for reconstruction directly on the device."""
+        coords = torch.linspace(-1.0, 1.0, self.density + 1, device=self.device, dtype=torch.float32)
+        # cartesian_prod varies the last axis fastest (ij order); swap the first two columns to keep
+        # the np.meshgrid 'xy' point ordering the reconstruction reshape/permute relies on
+        return torch.cartesian_prod(coords, coords, coords)[:, [1, 0, 2]][None]
 
     def _preprocess_point_cloud(self, surface: np.ndarray) -> torch.Tensor:
         """
@@ -117,15 +166,76 @@ class VecSetEncoder:
                 f"Point cloud must have {self.REQUIRED_POINT_COUNT} points, got {surface.shape[0]}"
             )
         
-        # Center and normalize
-        shifts = (surface.max(axis=0) + surface.min(axis=0)) / 2
-        surface = surface - shifts
+        # Upload once, then center and normalize in place on the device
+        surface_t = torch.from_numpy(np.asarray(surface, dtype=np.float32))
+        if self.device.type == "cuda":
+            surface_t = surface_t.pin_memory().to(self.device, non_blocking=True)
+        
+        # min and max in a single reduction
+        mins, maxs = surface_t.aminmax(dim=0)
+        shifts = (maxs + mins) / 2
+        surface_t -= shifts
         
-        distances = np.linalg.norm(surface, axis=1)
-        scale = 1 / np.max(distances)
-        surface *= scale
+        scale = 1 / surface_t.norm(dim=1).amax()
+        surface_t *= scale
         
-        return torch.from_numpy(surface.astype(np.float32)).to(self.device)
+        return surface_t
+
+    def load_surface(self, ply_file: Union[str, Path]) -> np.ndarray:
+        """
+        Load and validate the point cloud of a PLY file (CPU only).
+        
+        Args:
+            ply_file: Input PLY file
+            
+        Returns:
+            Point cloud vertices
+        """
+        mesh = trimesh.load(str(ply_file))
+        
+        if not hasattr(mesh, 'vertices') or len(mesh.vertices) == 0:
+            raise VecSetError("PLY file contains no vertices")
+        
+        surface = mesh.vertices
+        
+        if len(surface) != self.REQUIRED_POINT_COUNT:
+            raise VecSetError(f"Expected {self.REQUIRED_POINT_COUNT} points, got {len(surface)}")
+        
+        return surface
+
+    def encode_batch(self, surfaces: List[np.ndarray]) -> List[np.ndarray]:
+        """
+        Encode several point clouds to VecSets in a single forward pass.
+        
+        Args:
+            surfaces: Point clouds as returned by load_surface
+            
+        Returns:
+            One VecSet array per input point cloud
+        """
+        try:
+            batch = torch.stack([self._preprocess_point_cloud(surface) for surface in surfaces])
+            with torch.inference_mode(), self._autocast():
+                if self._compiled_encode is None:
+                    vecsets = self.encoder.encode_to_vecset(batch)["x"].float().cpu().numpy()
+                    return list(vecsets)
+
+                # The compiled head only ever sees warmed batch sizes: split batches larger than the
+                # biggest size and pad the rest up to the next size by repeating the last point cloud
+                vecsets = []
+                for chunk in batch.split(self.batch_sizes[-1]):
+                    n = len(chunk)
+                    size = next(size for size in self.batch_sizes if size >= n)
+                    if size > n:
+                        chunk = torch.cat([chunk, chunk[-1:].expand(size - n, -1, -1)])
+                    sampled = subsample(chunk, self.REQUIRED_POINT_COUNT, self.encoder.num_latents)
+                    # Copy out before the next replay reuses the CUDA graph's output buffer
+                    vecsets.extend(self._compiled_encode(sampled, chunk)["x"][:n].float().cpu().numpy())
+            return vecsets
+            
+        except Exception as e:
+            logger.error(f"VecSet batch encoding failed: {str(e)}")
+            raise VecSetError(f"VecSet batch encoding failed: {str(e)}") from e
 
     def to_vecset(
         self,
@@ -152,32 +262,33 @@ class VecSetEncoder:
         
         try:
             # Load PLY file
-            mesh = trimesh.load(str(ply_file))
-            
-            if not hasattr(mesh, 'vertices') or len(mesh.vertices) == 0:
-                raise VecSetError("PLY file contains no vertices")
-            
-            surface = mesh.vertices
-            
-            if len(surface) != self.REQUIRED_POINT_COUNT:
-                raise VecSetError(f"Expected {self.REQUIRED_POINT_COUNT} points, got {len(surface)}")
+            surface = self.load_surface(ply_file)
             
             # Preprocess
             surface_tensor = self._preprocess_point_cloud(surface)
             
             # Generate VecSet
-            with torch.no_grad():
+            # Outputs are cast back to FP32 so saved VecSets keep their dtype under autocast
+            with torch.inference_mode(), self._autocast():
                 if export_reconstruction:
-                    # Full forward pass with reconstruction
-                    outputs = self.encoder(surface_tensor[None], self.grid.to(self.device))
-                    vecset_data = outputs["x"].squeeze(0).cpu().numpy()
+                    # Encode, run the latent transformer and decode the query grid (chunked by the model)
+                    bottleneck = self.encoder.encode(surface_tensor[None])
+                    vecset_data = bottleneck["x"].squeeze(0).float().cpu().numpy()
+                    latents = self.encoder.learn(bottleneck["x"])
+                    outputs = self.encoder.decode_only(latents, self.grid)
                     
                     # Generate reconstruction
-                    volume = outputs["o"][0].view(
+                    # Negate in place and materialize the axis swap once, on the device
+                    volume = outputs["o"][0].float().neg_().view(
                         self.density + 1, self.density + 1, self.density + 1
-                    ).permute(1, 0, 2).cpu().numpy() * (-1)
+                    ).permute(1, 0, 2).contiguous()
                     
-                    verts, faces = mcubes.marching_cubes(volume, 0)
+                    if cuda_marching_cubes is not None and volume.is_cuda:
+                        # Extract the surface on the GPU; torchmcubes returns vertices in (z, y, x) order
+                        verts, faces = cuda_marching_cubes(volume, 0.0)
+                        verts, faces = verts[:, [2, 1, 0]].cpu().numpy(), faces.cpu().numpy()
+                    else:
+                        verts, faces = mcubes.marching_cubes(volume.cpu().numpy(), 0)
                     verts *= self.gap
                     verts -= 1.0
                     
@@ -191,7 +302,7 @@ class VecSetEncoder:
                 else:
                     # Just encode to VecSet
                     outputs = self.encoder.encode_to_vecset(surface_tensor[None])
-                    vecset_data = outputs["x"].squeeze(0).cpu().numpy()
+                    vecset_data = outputs["x"].squeeze(0).float().cpu().numpy()
                     reconstruction_file = None
             
             # Save VecSet
@@ -218,4 +329,8 @@ class VecSetEncoder:
 
     def is_ready(self) -> bool:
         """Check if encoder is ready."""
-        return hasattr(self, 'model_loaded') and self.model_loaded
\ No newline at end of file
+        return hasattr(self, 'model_loaded') and self.model_loaded
+
+    def is_compiled(self) -> bool:
+        """Check if the batched encode path runs the compiled (and warmed) model."""
+        return self._compiled_encode is not None
\ No newline at end of file
@@ -31,6 +31,7 @@ async def render_step_file(
     part_number: str = Form(...),
     render_mode: str = Form("shaded_with_edges"),
     total_imgs: int = Form(3),
+    silhouette_edges: bool = Form(False),
 ):
     tmp_path = None
     output_dir = None
@@ -57,7 +58,8 @@ async def render_step_file(
             edge_color=(0.1, 0.1, 0.1),
             edge_width=2.0,
             transparency=1.0,
-            total_imgs=total_imgs
+            total_imgs=total_imgs,
+            silhouette_edges=silhouette_edges
         )
 
         # Read images and encode as base64
@@ -6,14 +6,21 @@ Renders multiple PNG images from a STEP file using OCC and Pyrender according to
 import os
 import tempfile
 import gc
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
+from numba import njit
 
 # OCC imports
 from OCC.Core.STEPControl import STEPControl_Reader
 from OCC.Core.BRepMesh import BRepMesh_IncrementalMesh
 from OCC.Core.StlAPI import StlAPI_Writer
-from OCC.Core.TopExp import TopExp_Explorer
-from OCC.Core.TopAbs import TopAbs_EDGE
+from OCC.Core.TopExp import TopExp_Explorer, topexp
+from OCC.Core.TopAbs import TopAbs_EDGE, TopAbs_FACE
+from OCC.Core.TopoDS import topods
+from OCC.Core.TopTools import TopTools_IndexedDataMapOfShapeListOfShape, TopTools_ListIteratorOfListOfShape
+from OCC.Core.BRep import BRep_Tool
+from OCC.Core.BRepGProp import BRepGProp_Face
+from OCC.Core.gp import gp_Pnt, gp_Vec
 from OCC.Core.BRepAdaptor import BRepAdaptor_Curve
 from OCC.Core.GCPnts import GCPnts_UniformDeflection
 from OCC.Core.Bnd import Bnd_Box
@@ -23,13 +30,25 @@ from OCC.Core.BRepBndLib import brepbndlib
 try:
     import trimesh
     import pyrender
-    import imageio
+    import imageio.v3 as iio
     RENDERING_AVAILABLE = True
 except ImportError as e:
     RENDERING_AVAILABLE = False
     IMPORT_ERROR = str(e)
 
 
+def _load_step(step_file):
+    """read the STEP file and return its shape."""
+    reader = STEPControl_Reader()
+    status = reader.ReadFile(step_file)
+
+    if status != 1:
+        raise RuntimeError(f"STEP-file not found: {step_file}")
+
+    reader.TransferRoots()
+    return reader.OneShape()
+
+
 def extract_edges_from_step(step_file, deflection=0.1):
     """
     extract  edges from the STEP file.
@@ -41,21 +60,38 @@ def extract_edges_from_step(step_file, deflection=0.1):
     Returns:
         tuple: (edge_lines, bounds) - list of edge segments and bounding box
     """
-    reader = STEPControl_Reader()
-    status = reader.ReadFile(step_file)
+    return extract_edges_from_shape(_load_step(step_file), deflection)
 
-    if status != 1:
-        raise RuntimeError(f"STEP-file not found: {step_file}")
 
-    reader.TransferRoots()
-    shape = reader.OneShape()
+def extract_edges_from_shape(shape, deflection=0.1, with_face_data=False):
+    """
+    extract edges from an already loaded shape.
+
+    Args:
+        shape: OCC shape
+        deflection: tesselation accuracy
+        with_face_data: also return the adjacent face normals of every segment
 
+    Returns:
+        tuple: (edge_lines, bounds) - list of edge segments and bounding box,
+               (edge_lines, bounds, edge_face_data) with face data (normals, counts): zero-padded
+               (E, MAX_EDGE_FACES, 3) float32 normals of the adjacent faces at each segment midpoint
+               and (E,) normal counts
+    """
     # Bounding Box
     bbox = Bnd_Box()
     brepbndlib.Add(shape, bbox)
     xmin, ymin, zmin, xmax, ymax, zmax = bbox.Get()
     bounds = np.array([[xmin, ymin, zmin], [xmax, ymax, zmax]])
 
+    # faces adjacent to every edge are looked up once for the whole shape
+    if with_face_data:
+        edge_face_map = TopTools_IndexedDataMapOfShapeListOfShape()
+        topexp.MapShapesAndAncestors(shape, TopAbs_EDGE, TopAbs_FACE, edge_face_map)
+        segment_normals = []
+        segment_counts = []
+        point, normal = gp_Pnt(), gp_Vec()
+
     # Extrahiere Kanten
     edge_explorer = TopExp_Explorer(shape, TopAbs_EDGE)
     edge_lines = []
@@ -75,61 +111,88 @@ def extract_edges_from_step(step_file, deflection=0.1):
                     [p2.X(), p2.Y(), p2.Z()]
                 ])
 
+            if with_face_data:
+                # pcurve of the edge on every adjacent face; curved faces (cylinders, spheres, B-splines)
+                # change their normal along the edge, so it is evaluated per segment, not once per face
+                face_curves = []
+                face_iter = TopTools_ListIteratorOfListOfShape(edge_face_map.FindFromKey(edge))
+                while face_iter.More() and len(face_curves) < MAX_EDGE_FACES:
+                    face = topods.Face(face_iter.Value())
+                    pcurve, _, _ = BRep_Tool.CurveOnSurface(edge, face)
+                    if pcurve is not None:
+                        # BRepGProp_Face takes the face orientation into account
+                        face_curves.append((pcurve, BRepGProp_Face(face)))
+                    face_iter.Next()
+
+                for i in range(1, n_points):
+                    # face normals at the segment midpoint, via its (u, v) on each face
+                    t = (discretizer.Parameter(i) + discretizer.Parameter(i + 1)) / 2
+                    normals = [(0.0, 0.0, 0.0)] * MAX_EDGE_FACES
+                    k = 0
+                    for pcurve, face_props in face_curves:
+                        uv = pcurve.Value(t)
+                        face_props.Normal(uv.X(), uv.Y(), point, normal)
+                        if normal.Magnitude() > 1e-12:
+                            normal.Normalize()
+                            normals[k] = (normal.X(), normal.Y(), normal.Z())
+                            k += 1
+                    segment_normals.append(normals)
+                    segment_counts.append(k)
+
         edge_explorer.Next()
 
-    return edge_lines, bounds
+    if not with_face_data:
+        return edge_lines, bounds
+
+    edge_face_data = (np.array(segment_normals, dtype=np.float32).reshape(-1, MAX_EDGE_FACES, 3),
+                      np.array(segment_counts, dtype=np.int32))
+    return edge_lines, bounds, edge_face_data
 
 
 def convert_step_to_stl(step_file, stl_path, linear_deflection=0.1):
     """Konvertiert STEP zu STL."""
-    reader = STEPControl_Reader()
-    status = reader.ReadFile(step_file)
-
-    if status != 1:
-        raise RuntimeError(f"STEP-file not found: {step_file}")
+    return convert_shape_to_stl(_load_step(step_file), stl_path, linear_deflection)
 
-    reader.TransferRoots()
-    shape = reader.OneShape()
 
-    BRepMesh_IncrementalMesh(shape, linear_deflection)
+def convert_shape_to_stl(shape, stl_path, linear_deflection=0.1):
+    """tessellate an already loaded shape and write it as STL."""
+    # relative=False, angular deflection 0.5 rad, faces are meshed in parallel
+    BRepMesh_IncrementalMesh(shape, linear_deflection, False, 0.5, True)
 
+    # binary STL is much smaller and faster to write and to parse than ASCII
     writer = StlAPI_Writer()
+    writer.SetASCIIMode(False)
     writer.Write(shape, stl_path)
 
     return stl_path
 
 
+# max. number of adjacent face normals kept per edge segment for silhouette detection
+MAX_EDGE_FACES = 4
+
+
 def filter_silhouette_edges(edge_lines, edge_face_data, view_direction, box_center):
     """
     filter silhouette edges based on view direction.
 
     Args:
-        edge_lines: list of edge segments
-        edge_face_data: list of (segment_index, [face_normals])
+        edge_lines: list or (E, 2, 3) array of edge segments
+        edge_face_data: (normals, counts) of the edge segments, see extract_edges_from_shape
         view_direction: camera view direction
         box_center: center of the object bounding box
 
     Returns:
-        list: silhouette edge segments only
+        np.ndarray: silhouette edge segments only
     """
-    silhouette_edges = []
+    normals, counts = edge_face_data
 
-    for seg_idx, face_normals in edge_face_data:
-        if len(face_normals) == 0:
-            # always visible
-            silhouette_edges.append(edge_lines[seg_idx])
-        elif len(face_normals) == 1:
-            # always visible 
-            silhouette_edges.append(edge_lines[seg_idx])
-        elif len(face_normals) >= 2:
-            # inner angle between face normals and view direction
-            dot_products = [np.dot(n, view_direction) for n in face_normals]
+    # inner angle between all face normals and view direction at once (padding normals give 0)
+    dots = normals @ np.asarray(view_direction, dtype=np.float32)
 
-            # if signs differ, it's a silhouette edge
-            if any(d > 0.01 for d in dot_products) and any(d < -0.01 for d in dot_products):
-                silhouette_edges.append(edge_lines[seg_idx])
+    # edges with less than two faces are always visible; otherwise signs differ on silhouette edges
+    mask = (counts <= 1) | ((dots > 0.01).any(axis=1) & (dots < -0.01).any(axis=1))
 
-    return silhouette_edges
+    return np.asarray(edge_lines)[mask]
 
 
 def generate_camera_positions(num_views, box_center, cam_distance):
@@ -144,68 +207,114 @@ def generate_camera_positions(num_views, box_center, cam_distance):
     Returns:
         list: camera position dicts with 'name', 'position', 'direction', 'up_vector', 'azimuth', 'elevation'
     """
-    positions = []
+    golden_ratio = (1 + np.sqrt(5)) / 2
+    i = np.arange(num_views)
 
+    # Theta elevation and phi azimuth in rad
+    theta = np.arccos(1 - 2 * (i + 0.5) / num_views)
+    phi = 2 * np.pi * i / golden_ratio
 
-    golden_ratio = (1 + np.sqrt(5)) / 2
+    # spherical to Cartesian coordinates, all views at once
+    directions = np.column_stack([np.sin(theta) * np.cos(phi),
+                                  np.sin(theta) * np.sin(phi),
+                                  np.cos(theta)])
+    cam_positions = box_center + directions * cam_distance
+
+    # default up direction is the z axis; avoid the singularity at the poles with the y axis
+    up_vectors = np.where(np.abs(directions[:, 2:3]) > 0.9, [0, 1, 0], [0, 0, 1])
 
-    for i in range(num_views):
-        # Theta elevation in rad
-        theta = np.arccos(1 - 2 * (i + 0.5) / num_views)
+    # angle and elevation in degrees for the file names
+    angles_deg = (np.degrees(phi) % 360).astype(int)
+    elevs_deg = np.degrees(theta).astype(int)
 
-        # Phi azimuth in rad
-        phi = 2 * np.pi * i / golden_ratio
+    return [{
+        'name': f"view_{k:03d}_az{angle_deg:03d}_el{elev_deg:03d}",
+        'position': cam_pos,
+        'direction': -direction,  # Schaut zum Zentrum
+        'up_vector': up,
+        'azimuth': int(angle_deg),
+        'elevation': int(elev_deg)
+    } for k, (cam_pos, direction, up, angle_deg, elev_deg)
+        in enumerate(zip(cam_positions, directions, up_vectors, angles_deg, elevs_deg))]
 
-        #  spherical to Cartesian coordiates
-        x = np.sin(theta) * np.cos(phi)
-        y = np.sin(theta) * np.sin(phi)
-        z = np.cos(theta)
 
-        direction = np.array([x, y, z])
-        cam_pos = box_center + direction * cam_distance
+def create_camera_pose(cam_pos, target, up_vector):
+    """generate camera pose matrix from position, target and up vector."""
+    return create_camera_poses(np.asarray(cam_pos)[None], target, np.asarray(up_vector)[None])[0]
 
-        # define default up direction by z axis
-        up = np.array([0, 0, 1])
 
-        # avoid singularity at poles with the up vector
-        if abs(z) > 0.9:
-            up = np.array([0, 1, 0])
+def create_camera_poses(cam_positions, target, up_vectors):
+    """generate the (N, 4, 4) camera pose matrices of all views from positions, target and up vectors."""
+    cam_positions = np.ascontiguousarray(cam_positions, dtype=np.float64)
+    out = np.empty((len(cam_positions), 4, 4), dtype=np.float64)
+    _camera_poses(cam_positions, np.asarray(target, dtype=np.float64),
+                  np.ascontiguousarray(up_vectors, dtype=np.float64), out)
+    return out
 
-        # compute angle and elevation in degrees for file name
-        angle_deg = int(np.degrees(phi) % 360)
-        elev_deg = int(np.degrees(theta))
-        name = f"view_{i:03d}_az{angle_deg:03d}_el{elev_deg:03d}"
 
-        positions.append({
-            'name': name,
-            'position': cam_pos,
-            'direction': -direction,  # Schaut zum Zentrum
-            'up_vector': up,
-            'azimuth': angle_deg,
-            'elevation': elev_deg
-        })
+@njit(cache=True)
+def _normalize3(x, y, z):
+    norm = np.sqrt(x * x + y * y + z * z)
+    return x / norm, y / norm, z / norm
 
-    return positions
 
+@njit(cache=True)
+def _cross3(ax, ay, az, bx, by, bz):
+    return ay * bz - az * by, az * bx - ax * bz, ax * by - ay * bx
 
-def create_camera_pose(cam_pos, target, up_vector):
-    """generate camera pose matrix from position, target and up vector."""
-    forward = target - cam_pos
-    forward = forward / np.linalg.norm(forward)
 
-    right = np.cross(forward, up_vector)
-    right = right / np.linalg.norm(right)
+@njit(cache=True)
+def _camera_poses(cam_positions, target, up_vectors, out):
+    for k in range(cam_positions.shape[0]):
+        px, py, pz = cam_positions[k, 0], cam_positions[k, 1], cam_positions[k, 2]
+
+        fx, fy, fz = _normalize3(target[0] - px, target[1] - py, target[2] - pz)
+        rx, ry, rz = _normalize3(*_cross3(fx, fy, fz, up_vectors[k, 0], up_vectors[k, 1], up_vectors[k, 2]))
+        ux, uy, uz = _normalize3(*_cross3(rx, ry, rz, fx, fy, fz))
+
+        # columns: right, up, -forward, position
+        out[k, 0, 0], out[k, 1, 0], out[k, 2, 0], out[k, 3, 0] = rx, ry, rz, 0.0
+        out[k, 0, 1], out[k, 1, 1], out[k, 2, 1], out[k, 3, 1] = ux, uy, uz, 0.0
+        out[k, 0, 2], out[k, 1, 2], out[k, 2, 2], out[k, 3, 2] = -fx, -fy, -fz, 0.0
+        out[k, 0, 3], out[k, 1, 3], out[k, 2, 3], out[k, 3, 3] = px, py, pz, 1.0
+
 
-    up = np.cross(right, forward)
-    up = up / np.linalg.norm(up)
+# One offscreen renderer and one scene with resident lights are shared by all requests. A GL context
+# (EGL/OSMesa) is bound to the thread that created it, so a single render thread owns them: they are
+# created, used and deleted only inside tasks of _render_executor
+_render_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="render")
+_renderer = None
+_scene = None
 
-    camera_pose = np.eye(4)
-    camera_pose[:3, 0] = right
-    camera_pose[:3, 1] = up
-    camera_pose[:3, 2] = -forward
-    camera_pose[:3, 3] = cam_pos
+# PNG encoding (zlib releases the GIL) overlaps with rendering the next view
+_png_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="png-encode")
 
-    return camera_pose
+
+def _get_renderer(width, height):
+    """Return the shared offscreen renderer, recreating it only when the viewport size changes."""
+    global _renderer
+    if _renderer is not None and (_renderer.viewport_width, _renderer.viewport_height) != (width, height):
+        _renderer.delete()
+        _renderer = None
+    if _renderer is None:
+        _renderer = pyrender.OffscreenRenderer(viewport_width=width, viewport_height=height)
+    return _renderer
+
+
+def _get_scene():
+    """Return the shared scene with background, ambient light and the three directional lights."""
+    global _scene
+    if _scene is None:
+        _scene = pyrender.Scene(bg_color=[1.0, 1.0, 1.0, 1.0], ambient_light=[0.3, 0.3, 0.3])
+
+        # Lightning 
+        _scene.add(pyrender.DirectionalLight(color=[1.0, 1.0, 1.0], intensity=4.0),
+                   pose=np.array([[1,0,0,3],[0,1,0,-3],[0,0,1,5],[0,0,0,1]]))
+        _scene.add(pyrender.DirectionalLight(color=[1.0, 1.0, 1.0], intensity=2.5),
+                   pose=np.array([[1,0,0,-5],[0,1,0,0],[0,0,1,3],[0,0,0,1]]))
+        _scene.add(pyrender.DirectionalLight(color=[0.9, 0.9, 1.0], intensity=1.5),
+                   pose=np.array([[1,0,0,0],[0,1,0,5],[0,0,1,2],[0,0,0,1]]))
+    return _scene
 
 
 def render_geometry(stl_path, edge_lines, output_dir, basename,
@@ -217,7 +326,7 @@ def render_geometry(stl_path, edge_lines, output_dir, basename,
 
     Args:
         stl_path: path to STL file
-        edge_lines: list of edge segments
+        edge_lines: (E, 2, 3) float64 array of edge segments
         output_dir: directory to save images
         basename: base name for image files
         resolution: (width, height) of images
@@ -226,39 +335,49 @@ def render_geometry(stl_path, edge_lines, output_dir, basename,
         edge_width: width of edges in pixels
         transparency: transparency 0.0 (transparent) to 1.0 (opaque)
         total_imgs: total number of images to render
-        edge_face_data: list of (segment_index, [face_normals]) for silhouette detection
+        edge_face_data: (normals, counts) of the edge segments for silhouette detection, see extract_edges_from_shape
     Returns:
         dict: {'images': list, 'perspectives': list}
     """
     if not RENDERING_AVAILABLE:
         raise RuntimeError(f"Rendering was not successfull!")
 
+    # run on the render thread that owns the GL context, whichever thread calls in
+    rendered_images, perspectives, pending_writes = _render_executor.submit(
+        _render_geometry, stl_path, edge_lines, output_dir, basename, resolution, render_mode,
+        edge_color, edge_width, transparency, total_imgs, edge_face_data
+    ).result()
+
+    # all images are on disk before returning (re-raises encoding errors); waiting here keeps the
+    # render thread free for the next request
+    for output_path, write in pending_writes:
+        write.result()
+        print(f"Saved file: {output_path}")
+
+    return {
+        'images': rendered_images,
+        'perspectives': perspectives
+    }
+
+
+def _render_geometry(stl_path, edge_lines, output_dir, basename, resolution, render_mode,
+                     edge_color, edge_width, transparency, total_imgs, edge_face_data):
+    """
+    render_geometry on the render thread (see render_geometry for the arguments).
+
+    Returns:
+        tuple: (images, perspectives, pending_writes) - PNG writes as (path, future) pairs
+    """
     w, h = resolution
 
+    renderer = _get_renderer(w, h)
+
     # load file
-    mesh = None
+    pmesh = None
     if render_mode in ['shaded', 'shaded_with_edges']:
         mesh = trimesh.load_mesh(stl_path, force='mesh')
         bounds = mesh.bounds
-    else:
-        # only edges for wireframe modus
-        all_points = []
-        for line in edge_lines:
-            all_points.extend(line)
-        all_points = np.array(all_points)
-        bounds = np.array([all_points.min(axis=0), all_points.max(axis=0)])
 
-    box_center = (bounds[0] + bounds[1]) / 2
-    box_size = np.linalg.norm(bounds[1] - bounds[0])
-
-    print(f"modus: {render_mode}")
-    print(f"bb: {bounds[0]} to {bounds[1]}")
-
-    # Szene erstellen
-    scene = pyrender.Scene(bg_color=[1.0, 1.0, 1.0, 1.0], ambient_light=[0.3, 0.3, 0.3])
-
-    # Füge Geometrie basierend auf Modus hinzu
-    if render_mode in ['shaded', 'shaded_with_edges']:
         # Material mit Transparenz
         alpha = max(0.0, min(1.0, transparency))  # Clamp auf [0, 1]
         material = pyrender.MetallicRoughnessMaterial(
@@ -268,87 +387,100 @@ def render_geometry(stl_path, edge_lines, output_dir, basename,
             alphaMode='BLEND' if alpha < 1.0 else 'OPAQUE'
         )
         pmesh = pyrender.Mesh.from_trimesh(mesh, material=material, smooth=False)
-        scene.add(pmesh)
+    else:
+        # only edges for wireframe modus
+        all_points = np.asarray(edge_lines, dtype=np.float64).reshape(-1, 3)
+        bounds = np.array([all_points.min(axis=0), all_points.max(axis=0)])
 
-        # Lightning 
-        scene.add(pyrender.DirectionalLight(color=[1.0, 1.0, 1.0], intensity=4.0),
-                 pose=np.array([[1,0,0,3],[0,1,0,-3],[0,0,1,5],[0,0,0,1]]))
-        scene.add(pyrender.DirectionalLight(color=[1.0, 1.0, 1.0], intensity=2.5),
-                 pose=np.array([[1,0,0,-5],[0,1,0,0],[0,0,1,3],[0,0,0,1]]))
-        scene.add(pyrender.DirectionalLight(color=[0.9, 0.9, 1.0], intensity=1.5),
-                 pose=np.array([[1,0,0,0],[0,1,0,5],[0,0,1,2],[0,0,0,1]]))
+    box_center = (bounds[0] + bounds[1]) / 2
+    box_size = np.linalg.norm(bounds[1] - bounds[0])
 
-    # initialize renderer
-    renderer = pyrender.OffscreenRenderer(viewport_width=w, viewport_height=h)
+    print(f"modus: {render_mode}")
+    print(f"bb: {bounds[0]} to {bounds[1]}")
 
     # get camera positions
     cam_distance = box_size * 2.5
     camera_views = generate_camera_positions(total_imgs, box_center, cam_distance)
+    camera_poses = create_camera_poses([view['position'] for view in camera_views], box_center,
+                                       [view['up_vector'] for view in camera_views])
 
     rendered_images = []
     perspectives = []
+    pending_writes = []
 
-    for view_data in camera_views:
-        view_name = view_data['name']
-        cam_pos = view_data['position']
-        up_vector = view_data['up_vector']
-        view_direction = view_data['direction']
-
-        camera_pose = create_camera_pose(cam_pos, box_center, up_vector)
-
-        print(f"Rendering {view_name} (Azimuth: {view_data['azimuth']}°, Elevation: {view_data['elevation']}°)...")
+    # shared renderer and scene (lights stay resident); only the mesh node is swapped per call
+    scene = _get_scene()
+    mesh_node = scene.add(pmesh) if pmesh is not None else None
 
-        camera = pyrender.PerspectiveCamera(yfov=np.pi / 4.0, aspectRatio=w/h)
-        cam_node = scene.add(camera, pose=camera_pose)
+    # one camera node for all views; only its pose changes between renders
+    camera = pyrender.PerspectiveCamera(yfov=np.pi / 4.0, aspectRatio=w/h)
+    cam_node = scene.add(camera)
 
-        color, depth = renderer.render(scene)
+    # edge mask and output image are reused by all views
+    edge_mask = np.zeros((h, w), dtype=np.uint8)
+    out_buf = np.empty((h, w, 3), dtype=np.uint8)
 
-        # add edges
-        edges_to_draw = edge_lines
-        if render_mode == 'shaded' and edge_lines and edge_face_data:
-            # filter silhouette edges only
-            edges_to_draw = filter_silhouette_edges(edge_lines, edge_face_data, view_direction, box_center)
-            if edges_to_draw:
-                color = draw_edges_on_image(color, edges_to_draw, camera_pose,
+    try:
+        for view_data, camera_pose in zip(camera_views, camera_poses):
+            view_name = view_data['name']
+            cam_pos = view_data['position']
+            view_direction = view_data['direction']
+
+            print(f"Rendering {view_name} (Azimuth: {view_data['azimuth']}°, Elevation: {view_data['elevation']}°)...")
+
+            scene.set_pose(cam_node, camera_pose)
+
+            color, depth = renderer.render(scene)
+
+            # add edges
+            has_edges = edge_lines is not None and len(edge_lines) > 0
+            if render_mode == 'shaded' and has_edges and edge_face_data is not None:
+                # filter silhouette edges only
+                edges_to_draw = filter_silhouette_edges(edge_lines, edge_face_data, view_direction, box_center)
+                if len(edges_to_draw):
+                    color = draw_edges_on_image(color, edges_to_draw, camera_pose,
+                                               w, h, box_center, cam_distance,
+                                               edge_color, edge_width, edge_mask, out_buf)
+            elif render_mode in ['wireframe', 'shaded_with_edges'] and has_edges:
+                # process all edges on image
+                color = draw_edges_on_image(color, edge_lines, camera_pose,
                                            w, h, box_center, cam_distance,
-                                           edge_color, edge_width)
-        elif render_mode in ['wireframe', 'shaded_with_edges'] and edge_lines:
-            # process all edges on image
-            color = draw_edges_on_image(color, edge_lines, camera_pose,
-                                       w, h, box_center, cam_distance,
-                                       edge_color, edge_width)
-
-        # sace to image file
-        output_path = os.path.join(output_dir, f"{basename}_{view_name}.png")
-        imageio.imwrite(output_path, color)
-        print(f"Saved file: {output_path}")
-
-        rendered_images.append(f"{basename}_{view_name}.png")
-        perspectives.append({
-            'filename': f"{basename}_{view_name}.png",
-            'azimuth': view_data['azimuth'],
-            'elevation': view_data['elevation'],
-            'camera_position': cam_pos.tolist(),
-            'camera_direction': view_data['direction'].tolist()
-        })
+                                           edge_color, edge_width, edge_mask, out_buf)
+
+            # sace to image file in the background; the copy decouples it from the reused buffers
+            output_path = os.path.join(output_dir, f"{basename}_{view_name}.png")
+            # fast zlib level: files get slightly larger, encoding is several times quicker
+            pending_writes.append((output_path, _png_executor.submit(
+                iio.imwrite, output_path, color.copy(), plugin="pillow", extension=".png", compress_level=1
+            )))
+
+            rendered_images.append(f"{basename}_{view_name}.png")
+            perspectives.append({
+                'filename': f"{basename}_{view_name}.png",
+                'azimuth': view_data['azimuth'],
+                'elevation': view_data['elevation'],
+                'camera_position': cam_pos.tolist(),
+                'camera_direction': view_data['direction'].tolist()
+            })
 
+    finally:
+        # leave the shared scene with only its lights, even if a view failed
         scene.remove_node(cam_node)
+        if mesh_node is not None:
+            scene.remove_node(mesh_node)
 
-    renderer.delete()
-
-    return {
-        'images': rendered_images,
-        'perspectives': perspectives
-    }
+    return rendered_images, perspectives, pending_writes
 
 
 def draw_edges_on_image(image, edge_lines, camera_pose, width, height,
-                        center, distance, edge_color, edge_width):
-    """Draw edges on rendered image."""
-    from scipy import ndimage
-
-    # Create a writable copy of the image
-    image = np.array(image, copy=True)
+                        center, distance, edge_color, edge_width, mask_buf=None, out_buf=None):
+    """Draw edges on rendered image (optionally into preallocated (h, w) uint8 mask and (h, w, 3) output buffers)."""
+    # Create a writable copy of the image, reusing the output buffer if given
+    if out_buf is None:
+        image = np.array(image, copy=True)
+    else:
+        np.copyto(out_buf, image)
+        image = out_buf
 
     # generate view and projection matrices
     view_matrix = np.linalg.inv(camera_pose)
@@ -364,44 +496,52 @@ def draw_edges_on_image(image, edge_lines, camera_pose, width, height,
         [0, 0, -1, 0]
     ])
 
-    # get mask for edges
-    edge_mask = np.zeros((height, width), dtype=bool)
-
-    for line in edge_lines:
-        p1, p2 = np.array(line[0]), np.array(line[1])
-
-        # transform to clip space
-        p1_clip = proj_matrix @ view_matrix @ np.append(p1, 1)
-        p2_clip = proj_matrix @ view_matrix @ np.append(p2, 1)
-
-        # perspective divide
-        if abs(p1_clip[3]) > 1e-6 and abs(p2_clip[3]) > 1e-6:
-            p1_ndc = p1_clip[:3] / p1_clip[3]
-            p2_ndc = p2_clip[:3] / p2_clip[3]
-
-            # to screen space
-            x1 = int((p1_ndc[0] + 1) * width / 2)
-            y1 = int((1 - p1_ndc[1]) * height / 2)
-            x2 = int((p2_ndc[0] + 1) * width / 2)
-            y2 = int((1 - p2_ndc[1]) * height / 2)
-
-            # draw lines
-            if 0 <= x1 < width and 0 <= y1 < height and 0 <= x2 < width and 0 <= y2 < height:
-                draw_line(edge_mask, x1, y1, x2, y2)
-
-    # thicken the edges
-    if edge_width > 1:
-        edge_mask = ndimage.binary_dilation(edge_mask, iterations=int(edge_width))
+    # transform all segment endpoints to clip space at once
+    mvp = proj_matrix @ view_matrix
+    points = np.asarray(edge_lines, dtype=np.float64).reshape(-1, 3)
+    clip = (points @ mvp[:, :3].T + mvp[:, 3]).reshape(-1, 2, 4)
+
+    # cull segments with an endpoint behind (or on) the camera plane before the perspective divide;
+    # their divided coordinates would be mirrored through the image center
+    clip = clip[(clip[..., 3] > 1e-6).all(axis=1)]
+    ndc = clip[..., :2] / clip[..., 3:4]
+
+    # to screen space, keeping only segments that lie fully inside the image
+    xs = ((ndc[..., 0] + 1) * width / 2).astype(np.int64)
+    ys = ((1 - ndc[..., 1]) * height / 2).astype(np.int64)
+    inside = ((xs >= 0) & (xs < width) & (ys >= 0) & (ys < height)).all(axis=1)
+    segments = np.column_stack([xs[:, 0], ys[:, 0], xs[:, 1], ys[:, 1]])[inside].astype(np.int32)
+
+    # draw lines, thickened by stamping a diamond of radius edge_width around every line pixel
+    if mask_buf is None:
+        edge_mask = np.zeros((height, width), dtype=np.uint8)
+    else:
+        edge_mask = mask_buf
+        edge_mask.fill(0)
+    draw_lines_batch(edge_mask, segments, int(edge_width) if edge_width > 1 else 0)
 
-    # project to image
+    # project to image (the mask only holds 0/1, so it can be reinterpreted as bool without a copy)
     edge_color_rgb = (np.array(edge_color) * 255).astype(np.uint8)
-    image[edge_mask] = edge_color_rgb
+    image[edge_mask.view(bool)] = edge_color_rgb
 
     return image
 
 
-def draw_line(mask, x0, y0, x1, y1):
-    """Bresenham-Linienalgorithmus."""
+@njit(boundscheck=False, cache=True)
+def stamp_diamond(mask, x, y, radius):
+    """Set all pixels within L1 distance radius of (x, y); same footprint as radius cross-shaped dilations."""
+    height, width = mask.shape
+    for dy in range(-radius, radius + 1):
+        yy = y + dy
+        if 0 <= yy < height:
+            reach = radius - abs(dy)
+            for xx in range(max(x - reach, 0), min(x + reach, width - 1) + 1):
+                mask[yy, xx] = 1
+
+
+@njit(boundscheck=False, cache=True)
+def draw_line(mask, x0, y0, x1, y1, radius=0):
+    """Bresenham-Linienalgorithmus, optional mit Linienbreite (radius in Pixeln)."""
     dx = abs(x1 - x0)
     dy = abs(y1 - y0)
     sx = 1 if x0 < x1 else -1
@@ -410,7 +550,7 @@ def draw_line(mask, x0, y0, x1, y1):
 
     while True:
         if 0 <= x0 < mask.shape[1] and 0 <= y0 < mask.shape[0]:
-            mask[y0, x0] = True
+            stamp_diamond(mask, x0, y0, radius)
 
         if x0 == x1 and y0 == y1:
             break
@@ -424,11 +564,18 @@ def draw_line(mask, x0, y0, x1, y1):
             y0 += sy
 
 
+@njit(boundscheck=False, cache=True)
+def draw_lines_batch(mask, segments, radius=0):
+    """Draw all (x0, y0, x1, y1) screen-space segments into the uint8 mask in one nopython loop."""
+    for i in range(segments.shape[0]):
+        draw_line(mask, segments[i, 0], segments[i, 1], segments[i, 2], segments[i, 3], radius)
+
+
 def step_to_images(step_file, part_number, output_dir="./renders",
                    resolution=(1280, 720), stl_deflection=0.1,
                    cleanup_stl=True, render_mode='shaded_with_edges',
                    edge_color=(0.1, 0.1, 0.1), edge_width=2.0, transparency=1.0,
-                   total_imgs=3):
+                   total_imgs=3, silhouette_edges=False):
     """
     Render multiple images from a STEP file.
 
@@ -444,6 +591,7 @@ def step_to_images(step_file, part_number, output_dir="./renders",
         edge_width: width of edges in pixels
         transparency: transparency 0.0 (transparent) to 1.0 (opaque)
         total_imgs: total number of images to render
+        silhouette_edges: draw silhouette edges in 'shaded' mode (opt-in)
     Returns:
         dict: {'success': bool, 'output_dir': str, 'images': list, 'perspectives': list}
     """
@@ -458,29 +606,39 @@ def step_to_images(step_file, part_number, output_dir="./renders",
         print(f"Konvertiere: {step_file}")
         print(f"{'='*60}")
 
+        # parse the STEP file once for edge extraction and STL export
+        shape = _load_step(step_file)
+
         # extract edges and face data
         edge_lines = None
         edge_face_data = None
 
         if render_mode in ['wireframe', 'shaded_with_edges']:
             # all edges without face info
-            edge_lines, _ = extract_edges_from_step(step_file, deflection=stl_deflection)
-        elif render_mode == 'shaded':
+            edge_lines, _ = extract_edges_from_shape(shape, deflection=stl_deflection)
+        elif render_mode == 'shaded' and silhouette_edges:
             # edges with face info for silhouette detection
-            edge_lines, _ = extract_edges_from_step(step_file,
-                                                                     deflection=stl_deflection
-                                                                    )
+            edge_lines, _, edge_face_data = extract_edges_from_shape(shape,
+                                                                     deflection=stl_deflection,
+                                                                     with_face_data=True)
+        elif render_mode == 'shaded':
+            # plain shaded images without edge overlay
+            edge_lines, _ = extract_edges_from_shape(shape, deflection=stl_deflection)
+
+        # convert the edge list once; every view projects (and filters) this same contiguous array
+        if edge_lines is not None:
+            edge_lines = np.ascontiguousarray(edge_lines, dtype=np.float64).reshape(-1, 2, 3)
 
         # generate STL for rendering
         if render_mode != 'wireframe':
-            convert_step_to_stl(step_file, stl_path, linear_deflection=stl_deflection)
+            convert_shape_to_stl(shape, stl_path, linear_deflection=stl_deflection)
             print(f"✅ STL erstellt: {stl_path}")
 
         # start actual rendering
         print(f"\nRendere {total_imgs} Ansichten...")
         render_result = render_geometry(stl_path, edge_lines, part_output_dir, part_number,
                                        resolution, render_mode, edge_color, edge_width,
-                                       transparency, total_imgs)
+                                       transparency, total_imgs, edge_face_data)
 
         # save perspectives metadata
         import json